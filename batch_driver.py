@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Headless batch driver for the Prompt Iterator nodes
+Queues a full sweep of an API-format workflow against a ComfyUI server,
+pinning each queued copy to an explicit prompt index and seed
+Author: BiloxiStudios Inc - BizaNator
+Version: 2.1.0
+"""
+
+import argparse
+import copy
+import http.client
+import json
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:
+    from .prompt_iterator import NODE_CLASS_MAPPINGS, plan_schedule
+except ImportError:
+    from prompt_iterator import NODE_CLASS_MAPPINGS, plan_schedule
+
+# Node classes whose seed output can be pinned through generation_seed
+SEEDED_NODES = ("PromptIteratorDynamic", "PromptIteratorAdvanced")
+
+
+class BatchSubmitError(Exception):
+    """Raised when the server rejects a queued workflow"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def find_iterator_node(workflow: Dict[str, Any], node_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """Return the (id, node) of the prompt iterator in an API-format workflow"""
+    if node_id is not None:
+        return node_id, workflow[node_id]
+    for candidate_id, node in workflow.items():
+        if isinstance(node, dict) and node.get("class_type") in NODE_CLASS_MAPPINGS:
+            return candidate_id, node
+    raise ValueError("No Prompt Iterator node found in workflow")
+
+
+def build_sweep(node: Dict[str, Any], passes: int = 1, count: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Explicit (index, seed) items covering the node's prompt list.
+    count overrides the prompt count, which is required for the dynamic node
+    since its prompts arrive through links.
+    """
+    inputs = node.get("inputs", {})
+    if count is None:
+        prompts = inputs.get("prompts")
+        if not isinstance(prompts, str):
+            raise ValueError("Cannot count prompts from node inputs, pass count explicitly")
+        count = len([p for p in prompts.strip().split('\n') if p.strip()])
+    if count <= 0:
+        return []
+
+    mode = inputs.get("mode", "sequential")
+    if mode not in ("sequential", "random"):
+        mode = "sequential"
+    generation_seed = inputs.get("generation_seed", -1)
+    if not isinstance(generation_seed, int):  # Linked from another node
+        generation_seed = -1
+    labels = inputs.get("groups") or inputs.get("suffixes") or ""
+    group_labels = [g.strip() for g in labels.strip().split('\n') if g.strip()] if isinstance(labels, str) else []
+    return plan_schedule(
+        count, count * max(1, passes),
+        mode=mode,
+        loop_mode="loop",
+        seed_mode=inputs.get("seed_mode", "increment_batch"),
+        generation_seed=generation_seed,
+        random_strategy=inputs.get("random_strategy", "shuffle"),
+        group_labels=group_labels
+    )
+
+
+def pin_item(workflow: Dict[str, Any], node_id: str, index: int, seed: int, workflow_id: str) -> Dict[str, Any]:
+    """Copy the workflow with the iterator node pinned to one index and seed"""
+    pinned = copy.deepcopy(workflow)
+    node = pinned[node_id]
+    inputs = node.setdefault("inputs", {})
+    inputs["mode"] = "manual"
+    inputs["manual_index"] = index
+    inputs["workflow_id"] = workflow_id
+    if node.get("class_type") in SEEDED_NODES:
+        # A reset with a fixed seed makes the node emit exactly this seed
+        inputs["reset"] = True
+        inputs["seed_mode"] = "fixed"
+        inputs["generation_seed"] = seed
+    if node.get("class_type") == "PromptIteratorAdvanced":
+        # Each queued copy is one sweep item, batch emission would render extra items
+        inputs["batch_size"] = 1
+    return pinned
+
+
+class BatchDriver:
+    """
+    Submits pinned workflow copies to a ComfyUI /prompt endpoint.
+    At most `window` items are in flight; with wait enabled an item stays in
+    flight until it appears in /history. Each worker thread keeps one
+    persistent HTTP connection.
+    """
+
+    def __init__(self, server: str = "http://127.0.0.1:8188", window: int = 2,
+                 retries: int = 3, backoff: float = 0.5, wait: bool = True,
+                 poll_interval: float = 0.5, timeout: float = 3600.0,
+                 client_id: Optional[str] = None):
+        parts = urlsplit(server if "://" in server else f"http://{server}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.window = max(1, window)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.client_id = client_id or uuid.uuid4().hex
+        self._local = threading.local()
+
+    def run(self, workflow: Dict[str, Any], items: Optional[List[Tuple[int, int]]] = None,
+            node_id: Optional[str] = None, passes: int = 1, count: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Queue every (index, seed) item and return one result record per item, in order"""
+        node_id, node = find_iterator_node(workflow, node_id)
+        if items is None:
+            items = build_sweep(node, passes, count)
+        workflow_id = f"batch_{self.client_id[:8]}"
+        jobs = [pin_item(workflow, node_id, index, seed, workflow_id) for index, seed in items]
+
+        with ThreadPoolExecutor(max_workers=self.window, thread_name_prefix="prompt_batch") as executor:
+            futures = [executor.submit(self._run_item, job, index, seed)
+                       for job, (index, seed) in zip(jobs, items)]
+            return [future.result() for future in futures]
+
+    def _run_item(self, job: Dict[str, Any], index: int, seed: int) -> Dict[str, Any]:
+        record = {"index": index, "seed": seed, "prompt_id": None, "status": "error",
+                  "attempts": 0, "error": None, "outputs": None}
+        started = time.perf_counter()
+        try:
+            prompt_id = self._submit(job, record)
+            record["prompt_id"] = prompt_id
+            if self.wait:
+                entry = self._wait_for(prompt_id)
+                record["status"] = entry.get("status", {}).get("status_str", "success")
+                record["outputs"] = entry.get("outputs")
+                if record["status"] != "success":
+                    record["error"] = f"Execution finished with status {record['status']!r}"
+            else:
+                record["status"] = "queued"
+        except Exception as e:
+            record["error"] = str(e)
+        record["elapsed"] = round(time.perf_counter() - started, 3)
+        return record
+
+    def _submit(self, job: Dict[str, Any], record: Dict[str, Any]) -> str:
+        body = json.dumps({"prompt": job, "client_id": self.client_id}).encode("utf-8")
+        while True:
+            record["attempts"] += 1
+            try:
+                status, payload = self._request("POST", "/prompt", body)
+                if status == 200 and "prompt_id" in payload:
+                    return payload["prompt_id"]
+                raise BatchSubmitError(f"HTTP {status}: {json.dumps(payload)[:500]}", retryable=status >= 500)
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                error = BatchSubmitError(str(e), retryable=True)
+            except BatchSubmitError as e:
+                error = e
+            if not error.retryable or record["attempts"] > self.retries:
+                raise error
+            time.sleep(self.backoff * (2 ** (record["attempts"] - 1)))
+
+    def _wait_for(self, prompt_id: str) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            try:
+                status, payload = self._request("GET", f"/history/{prompt_id}")
+            except (OSError, http.client.HTTPException, ValueError):
+                status, payload = 0, {}
+            if status == 200 and prompt_id in payload:
+                return payload[prompt_id]
+            time.sleep(self.poll_interval)
+        raise TimeoutError(f"Prompt {prompt_id} did not finish within {self.timeout}s")
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, Any]:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            connection = self._local.connection = connection_class(self.host, self.port, timeout=60)
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            connection.request(method, self.base_path + path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        except Exception:
+            # Drop the broken connection so the next request reconnects
+            connection.close()
+            self._local.connection = None
+            raise
+        return response.status, json.loads(data) if data else {}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Queue a full Prompt Iterator sweep against a ComfyUI server")
+    parser.add_argument("workflow", help="Workflow exported with 'Save (API Format)'")
+    parser.add_argument("--server", default="http://127.0.0.1:8188", help="ComfyUI server URL")
+    parser.add_argument("--node", default=None, help="Iterator node id (default: first iterator found)")
+    parser.add_argument("--count", type=int, default=None, help="Prompt count (required for the dynamic node)")
+    parser.add_argument("--passes", type=int, default=1, help="Number of passes through the prompt list")
+    parser.add_argument("--window", type=int, default=2, help="Maximum items in flight")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per item on server or network errors")
+    parser.add_argument("--no-wait", action="store_true", help="Only bound submissions, do not wait for completion")
+    parser.add_argument("--results", default=None, help="Write one JSON result record per line to this file")
+    args = parser.parse_args(argv)
+
+    with open(args.workflow, encoding="utf-8") as handle:
+        workflow = json.load(handle)
+
+    driver = BatchDriver(args.server, window=args.window, retries=args.retries, wait=not args.no_wait)
+    results = driver.run(workflow, node_id=args.node, passes=args.passes, count=args.count)
+
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as handle:
+            for record in results:
+                handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    failed = [record for record in results if record["error"]]
+    print(f"Queued {len(results)} items, {len(failed)} failed")
+    for record in failed:
+        print(f"  index {record['index']}: {record['error']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
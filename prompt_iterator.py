@@ -5,13 +5,810 @@ Author: BiloxiStudios Inc - BizaNator
 Version: 2.1.0
 """
 
+import atexit
+import cProfile
+import functools
+import hashlib
 import json
+import os
 import random
-from typing import Dict, List, Tuple, Any, Optional
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple, Any, Optional
 
 # Global state management for tracking iteration position
 ITERATOR_STATE: Dict[str, Dict[str, Any]] = {}
 
+# Open metadata sidecar writers, keyed by sidecar path
+METADATA_WRITERS: Dict[str, "MetadataWriter"] = {}
+
+# Validated filename plans, keyed by a hash of the filename inputs
+FILENAME_PLANS: "OrderedDict[str, Tuple[Tuple[str, ...], int]]" = OrderedDict()
+FILENAME_PLAN_CACHE_SIZE = 32
+
+# Prefetchers warmed with upcoming filenames, keyed by ITERATOR_STATE key
+PREFETCHERS: Dict[str, "Prefetcher"] = {}
+
+_MASK64 = (1 << 64) - 1
+
+
+class StepProfiler:
+    """
+    Opt-in timing of the node hot path.
+    Per-phase durations from perf_counter_ns are kept in fixed-size ring
+    buffers; cProfile collection around node executions can be started and
+    dumped on demand.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = max(1, capacity)
+        self.cprofile: Optional[cProfile.Profile] = None
+        self._samples: Dict[str, deque] = {}
+
+    def lap(self, phase: str, started: int) -> int:
+        """Record the time since started under phase and return the current time"""
+        now = time.perf_counter_ns()
+        samples = self._samples.get(phase)
+        if samples is None:
+            samples = self._samples[phase] = deque(maxlen=self.capacity)
+        samples.append(now - started)
+        return now
+
+    def histograms(self) -> Dict[str, Dict[str, float]]:
+        """Count plus mean/p50/p95/p99/max in microseconds for each phase"""
+        report = {}
+        for phase, samples in self._samples.items():
+            ordered = sorted(samples)
+            if not ordered:
+                continue
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] / 1000.0
+            report[phase] = {
+                "count": len(ordered),
+                "mean_us": sum(ordered) / len(ordered) / 1000.0,
+                "p50_us": pick(0.50),
+                "p95_us": pick(0.95),
+                "p99_us": pick(0.99),
+                "max_us": ordered[-1] / 1000.0
+            }
+        return report
+
+    def report(self) -> str:
+        """Human-readable table of the phase histograms"""
+        lines = [f"{'phase':<24}{'count':>8}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}"]
+        for phase, stats in sorted(self.histograms().items()):
+            lines.append(f"{phase:<24}{stats['count']:>8}{stats['p50_us']:>10.1f}"
+                         f"{stats['p95_us']:>10.1f}{stats['p99_us']:>10.1f}")
+        return "\n".join(lines)
+
+    def reset(self):
+        self._samples.clear()
+
+    def start_cprofile(self):
+        """Collect cProfile data for node executions from now on"""
+        if self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+
+    def dump_cprofile(self, path: str):
+        """Write collected cProfile stats to path and stop collecting"""
+        if self.cprofile is not None:
+            profile, self.cprofile = self.cprofile, None
+            profile.dump_stats(path)
+
+
+# Set PROMPT_ITERATOR_PROFILE=1 to time each step; off by default so nodes pay nothing
+PROFILER: Optional[StepProfiler] = None
+if os.environ.get("PROMPT_ITERATOR_PROFILE", "").lower() not in ("", "0", "false", "no"):
+    PROFILER = StepProfiler(int(os.environ.get("PROMPT_ITERATOR_PROFILE_SAMPLES", "4096")))
+    if os.environ.get("PROMPT_ITERATOR_CPROFILE"):
+        PROFILER.start_cprofile()
+        atexit.register(PROFILER.dump_cprofile, os.environ["PROMPT_ITERATOR_CPROFILE"])
+
+
+def _profiled(phase: str):
+    """Time a node entry point (and feed cProfile) when profiling is enabled"""
+    def decorate(method):
+        if PROFILER is None:
+            return method
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter_ns()
+            profile = PROFILER.cprofile
+            if profile is not None:
+                profile.enable()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                PROFILER.lap(phase, started)
+        return wrapper
+    return decorate
+
+
+def _lap(phase: Optional[str] = None, started: int = 0) -> int:
+    """
+    Phase timing inside a node entry point: _lap() starts the clock and
+    _lap(phase, started) records the time since started and restarts it.
+    Returns 0 without reading the clock when profiling is disabled.
+    """
+    if PROFILER is None:
+        return 0
+    if phase is None:
+        return time.perf_counter_ns()
+    return PROFILER.lap(phase, started)
+
+
+def _mix64(value: int) -> int:
+    """SplitMix64 finalizer, used to derive permutation keys"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def _pass_key(shuffle_key: int, iteration: int) -> int:
+    """Permutation key for one pass through the prompt list"""
+    return _mix64((shuffle_key << 32) ^ iteration)
+
+
+def _permute_index(position: int, total: int, key: int) -> int:
+    """
+    Map a position to its slot in a keyed permutation of range(total).
+    Uses a small Feistel network with cycle walking, so the shuffled
+    order is never materialized and any position can be looked up directly.
+    """
+    if total <= 1:
+        return 0
+    half_bits = max(1, ((total - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    round_keys = [_mix64(key + round_index) for round_index in range(4)]
+    value = position
+    while True:
+        left, right = value >> half_bits, value & mask
+        for round_key in round_keys:
+            left, right = right, left ^ (_mix64(round_key ^ right) & mask)
+        value = (left << half_bits) | right
+        if value < total:
+            return value
+
+
+# Iterator state carried by a serialized cursor
+CURSOR_FIELDS = ("index", "iteration", "direction", "shuffle_key", "base_seed", "current_seed", "strata")
+
+
+def _initial_state(generation_seed: int = -1, deterministic: bool = False) -> Dict[str, Any]:
+    """
+    Fresh iterator state, seeded from generation_seed when it is set.
+    Unset values are drawn at random, or derived from generation_seed
+    (0 when unset) when deterministic, as cursor execution requires.
+    """
+    if deterministic:
+        seed = shuffle_key = max(0, generation_seed)
+    else:
+        seed = generation_seed if generation_seed >= 0 else random.randint(0, 2147483647)
+        shuffle_key = random.randint(0, 2147483647)
+    return {
+        "index": 0,
+        "iteration": 0,
+        "direction": 1,  # For ping-pong mode
+        "shuffle_key": shuffle_key,  # Permutation key for random mode
+        "base_seed": seed,
+        "current_seed": seed
+    }
+
+
+def _resolve_state(state_key: str, cursor_fields: Optional[Dict[str, Any]],
+                   generation_seed: int, reset: bool) -> Dict[str, Any]:
+    """
+    State for this execution: a private state built from the cursor when one
+    is given, otherwise the shared state for state_key. Reset restarts either.
+    """
+    if cursor_fields is not None:
+        state = _initial_state(generation_seed, deterministic=True)
+        if not reset:
+            state.update(cursor_fields)
+        return state
+
+    if state_key not in ITERATOR_STATE:
+        ITERATOR_STATE[state_key] = _initial_state(generation_seed)
+    state = ITERATOR_STATE[state_key]
+    if reset:
+        state.update(_initial_state(generation_seed))
+    return state
+
+
+def parse_cursor(cursor: str) -> Optional[Dict[str, int]]:
+    """Parse a serialized cursor, returning None when it is empty"""
+    if not cursor or not cursor.strip():
+        return None
+    try:
+        data = json.loads(cursor)
+        fields = {field: int(data[field]) for field in CURSOR_FIELDS if field in data and field != "strata"}
+        if "strata" in data:
+            fields["strata"] = [int(value) for value in data["strata"]]
+        return fields
+    except (ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid iterator cursor: {cursor!r}") from e
+
+
+def dump_cursor(state: Dict[str, Any]) -> str:
+    """Serialize the iterator state as a compact cursor string"""
+    return json.dumps({field: state[field] for field in CURSOR_FIELDS if field in state},
+                      separators=(",", ":"))
+
+
+@functools.lru_cache(maxsize=32)
+def build_strata(labels: Tuple[str, ...], total_count: int) -> Tuple[Tuple[int, ...], ...]:
+    """
+    Group prompt indices by label (suffix or tag), in order of first appearance.
+    Prompts without a label share one unlabeled group.
+    """
+    groups: Dict[str, List[int]] = {}
+    for index in range(total_count):
+        groups.setdefault(labels[index] if index < len(labels) else "", []).append(index)
+    return tuple(tuple(members) for members in groups.values())
+
+
+def _random_pick(state: Dict[str, Any], position: int, total_count: int,
+                 random_strategy: str, strata: Optional[Tuple[Tuple[int, ...], ...]]) -> int:
+    """Prompt index at a position of the current random pass"""
+    shuffle_key, iteration = state["shuffle_key"], state["iteration"]
+    pass_key = _pass_key(shuffle_key, iteration)
+
+    if random_strategy == "stratified" and strata:
+        # Smooth weighted round-robin over groups: every group gets its share of
+        # each pass spread evenly, tracked with one (credit, taken) pair per group
+        counters = state.get("strata")
+        if position == 0 or not counters or len(counters) != 2 * len(strata):
+            counters = state["strata"] = [0] * (2 * len(strata))
+        chosen, best = 0, None
+        for group, members in enumerate(strata):
+            counters[2 * group] += len(members)
+            rank = (counters[2 * group], _mix64(pass_key ^ group))
+            if best is None or rank > best:
+                chosen, best = group, rank
+        counters[2 * chosen] -= total_count
+        taken = counters[2 * chosen + 1]
+        counters[2 * chosen + 1] = taken + 1
+        members = strata[chosen]
+        return members[_permute_index(taken % len(members), len(members), _mix64(pass_key + chosen))]
+
+    if random_strategy == "no_repeat" and total_count == 2:
+        # With two prompts every pass must open with the prompt that opened the
+        # previous one, so all passes repeat the first pass's order
+        return _permute_index(position, total_count, _pass_key(shuffle_key, 0))
+
+    current_index = _permute_index(position, total_count, pass_key)
+    if random_strategy == "no_repeat" and iteration > 0 and position < 2 and total_count > 2:
+        # Swap the first two slots when the pass would open with the previous pass's last prompt.
+        # With three or more prompts the swap never reaches the last slot, so the previous
+        # pass's last prompt is its unswapped permutation value.
+        previous_last = _permute_index(total_count - 1, total_count, _pass_key(shuffle_key, iteration - 1))
+        first = current_index if position == 0 else _permute_index(0, total_count, pass_key)
+        if first == previous_last:
+            current_index = _permute_index(1 - position, total_count, pass_key)
+    return current_index
+
+
+def _advance_cursor(state: Dict[str, Any], mode: str, loop_mode: str,
+                    total_count: int, manual_index: int = 0, random_strategy: str = "shuffle",
+                    strata: Optional[Tuple[Tuple[int, ...], ...]] = None) -> int:
+    """Return the prompt index for this step and advance the state in place"""
+    if mode == "manual":
+        return max(0, min(manual_index, total_count - 1))
+    if mode == "single":
+        return 0
+
+    if mode == "random":
+        # Fixed permutation per pass, keyed by the shuffle key and iteration
+        position = state["index"] % total_count
+        current_index = _random_pick(state, position, total_count, random_strategy, strata)
+        state["index"] = (position + 1) % total_count
+        if state["index"] == 0:
+            state["iteration"] += 1
+        return current_index
+
+    # sequential
+    current_index = state["index"]
+    if loop_mode == "once":
+        if state["index"] < total_count - 1:
+            state["index"] += 1
+    elif loop_mode == "ping_pong":
+        state["index"] += state["direction"]
+        if state["index"] >= total_count - 1:
+            state["direction"] = -1
+            state["index"] = total_count - 1
+        elif state["index"] <= 0:
+            state["direction"] = 1
+            state["index"] = 0
+            state["iteration"] += 1
+    else:  # loop
+        state["index"] = (state["index"] + 1) % total_count
+        if state["index"] == 0:
+            state["iteration"] += 1
+    return current_index
+
+
+def _next_seed(state: Dict[str, Any], seed_mode: str, current_index: int,
+               deterministic: bool = False) -> int:
+    """
+    Return the seed for this step, incrementing the stored seed when the mode asks for it.
+    Deterministic random seeds are hashed from the stored seed so a cursor reproduces them.
+    """
+    if seed_mode == "random":
+        if deterministic:
+            state["current_seed"] = _mix64(state["current_seed"]) & 0x7FFFFFFF
+            return state["current_seed"]
+        return random.randint(0, 2147483647)
+    if seed_mode == "increment_prompt" or (
+            seed_mode == "increment_batch" and current_index == 0 and state["iteration"] > 0):
+        state["current_seed"] = (state["current_seed"] + 1) % 2147483648
+    return state["current_seed"]
+
+
+def _format_filename(filename_mode: str, base_filename: str, filename_list: List[str],
+                     suffix_list: List[str], filename_template: str, current_index: int) -> str:
+    """Build the output filename for a prompt index"""
+    if filename_mode == "list" and filename_list and current_index < len(filename_list):
+        return filename_list[current_index]
+    if filename_mode == "suffix_list" and suffix_list:
+        suffix = suffix_list[current_index] if current_index < len(suffix_list) else f"_{current_index:03d}"
+        return f"{base_filename}{suffix}"
+    if filename_mode == "template":
+        suffix = suffix_list[current_index] if current_index < len(suffix_list) else ""
+        return filename_template.format(
+            base=base_filename,
+            index=current_index,
+            suffix=suffix.lstrip('_')  # Remove leading underscore if present
+        )
+    # auto_index / index mode
+    return f"{base_filename}_{current_index:03d}"
+
+
+def plan_filenames(filename_args: Tuple, prompt_list: List[str],
+                   collision_mode: str = "warn") -> Tuple[Tuple[str, ...], int]:
+    """
+    Build the filename for every prompt index and check them for duplicates.
+    Returns (filenames, duplicate_count). With "counter" or "short_hash" the
+    repeats get a _2/_3 counter or a short prompt hash appended; with "warn"
+    they are only counted. Results are cached per input hash, so steps after
+    the first are a single lookup.
+    """
+    key_parts = [list(filename_args), len(prompt_list), collision_mode]
+    if collision_mode == "short_hash":
+        key_parts.append(prompt_list)
+    plan_key = hashlib.sha1(json.dumps(key_parts).encode("utf-8")).hexdigest()
+    cached = FILENAME_PLANS.get(plan_key)
+    if cached is not None:
+        FILENAME_PLANS.move_to_end(plan_key)
+        return cached
+
+    names = [_format_filename(*filename_args, index) for index in range(len(prompt_list))]
+    taken = set(names)
+    seen = set()
+    occurrences: Dict[str, int] = {}
+    duplicates = 0
+    for index, name in enumerate(names):
+        if name not in seen:
+            seen.add(name)
+            continue
+        duplicates += 1
+        if collision_mode == "warn":
+            continue
+        if collision_mode == "short_hash":
+            digest = hashlib.sha1(prompt_list[index].encode("utf-8")).hexdigest()[:6]
+            unique = f"{name}_{digest}"
+        else:
+            unique = name
+        # Fall back to a counter when the hash (identical prompt text) still collides
+        while unique in taken:
+            occurrences[name] = occurrences.get(name, 1) + 1
+            unique = f"{name}_{occurrences[name]}"
+        taken.add(unique)
+        names[index] = unique
+
+    result = (tuple(names), duplicates)
+    FILENAME_PLANS[plan_key] = result
+    while len(FILENAME_PLANS) > FILENAME_PLAN_CACHE_SIZE:
+        FILENAME_PLANS.popitem(last=False)
+    return result
+
+
+def _filename_status(duplicates: int, collision_mode: str) -> str:
+    """Status suffix reporting duplicate filenames"""
+    if not duplicates:
+        return ""
+    if collision_mode == "warn":
+        return f" | {duplicates} duplicate filename(s)"
+    return f" | {duplicates} filename(s) disambiguated"
+
+
+class PromptTransforms:
+    """
+    Ordered prompt rewrite rules, compiled once per rule text.
+    One rule per line; blank lines and lines starting with # are ignored:
+        prepend: TEXT            add TEXT before the prompt
+        append: TEXT             add TEXT after the prompt
+        replace: OLD => NEW      literal replacement
+        regex: PATTERN => REPL   regular expression substitution
+        if: PATTERN => CLAUSE    append CLAUSE when PATTERN matches
+        strip                    trim surrounding whitespace
+    TEXT, NEW, REPL and CLAUSE may use {index}, {suffix}, {base} and {filename}.
+    Rules apply in order, so replace rules chain. Consecutive replace rules
+    whose texts cannot interact are merged into one lookup table and applied
+    together in a single pass, which gives the same result.
+    """
+
+    PLACEHOLDERS = ("{index}", "{suffix}", "{base}", "{filename}")
+    RULE_PATTERN = re.compile(r"^(prepend|append|replace|regex|if):\s?(.*)$")
+
+    def __init__(self, rules: str):
+        self.steps: List[Tuple[str, Any, Any, bool]] = []
+        for line_number, line in enumerate(rules.split('\n'), 1):
+            # Keep trailing whitespace, it can be part of prepend/append text
+            line = line.rstrip('\r').lstrip()
+            if not line.strip() or line.startswith("#"):
+                continue
+            if line.strip() == "strip":
+                self.steps.append(("strip", None, None, False))
+                continue
+            match = self.RULE_PATTERN.match(line)
+            if match is None:
+                raise ValueError(f"Invalid transform rule on line {line_number}: {line!r}")
+            kind, argument = match.groups()
+            if kind in ("prepend", "append"):
+                self.steps.append((kind, None, argument, self._templated(argument)))
+                continue
+
+            source, separator, target = argument.partition(" => ")
+            if not separator or not source:
+                raise ValueError(f"Transform rule on line {line_number} needs 'PATTERN => VALUE': {line!r}")
+            if kind == "replace":
+                self._add_replacement(source, target)
+                continue
+            try:
+                pattern = re.compile(source)
+            except re.error as e:
+                raise ValueError(f"Invalid regex on line {line_number}: {e}") from e
+            self.steps.append((kind, pattern, target, self._templated(target)))
+
+        # Compile merged literal tables into one alternation, longest keys first
+        for position, (kind, table, _, templated) in enumerate(self.steps):
+            if kind == "table":
+                keys = sorted(table, key=len, reverse=True)
+                pattern = re.compile("|".join(re.escape(key) for key in keys))
+                self.steps[position] = (kind, pattern, table, templated)
+
+    def _templated(self, value: str) -> bool:
+        return any(placeholder in value for placeholder in self.PLACEHOLDERS)
+
+    @staticmethod
+    def _overlaps(first: str, second: str) -> bool:
+        """True when one text contains the other or they can share characters at a seam"""
+        if first in second or second in first:
+            return True
+        return any(first.endswith(second[:size]) or second.endswith(first[:size])
+                   for size in range(1, min(len(first), len(second))))
+
+    def _add_replacement(self, source: str, target: str):
+        templated = self._templated(target)
+        if self.steps and self.steps[-1][0] == "table" and not templated and not self.steps[-1][3]:
+            table = self.steps[-1][1]
+            # Merging is only safe when running this rule after the table could
+            # not match text the table touched, or text spanning its output.
+            # A deletion joins its neighbours into text any later rule may match
+            if all(table.values()) and not any(self._overlaps(source, key) or self._overlaps(source, value)
+                                               for key, value in table.items()):
+                table[source] = target
+                return
+        self.steps.append(("table", {source: target}, None, templated))
+
+    @staticmethod
+    def _fill(value: str, context: Dict[str, str], escape: bool = False) -> str:
+        for name, replacement in context.items():
+            if escape:
+                replacement = replacement.replace("\\", "\\\\")
+            value = value.replace("{" + name + "}", replacement)
+        return value
+
+    def _apply_step(self, step: Tuple[str, Any, Any, bool], text: str, context: Dict[str, str]) -> str:
+        kind, matcher, value, templated = step
+        if kind == "prepend":
+            return (self._fill(value, context) if templated else value) + text
+        if kind == "append":
+            return text + (self._fill(value, context) if templated else value)
+        if kind == "table":
+            if templated:
+                return matcher.sub(lambda m: self._fill(value[m.group(0)], context), text)
+            return matcher.sub(lambda m: value[m.group(0)], text)
+        if kind == "regex":
+            return matcher.sub(self._fill(value, context, escape=True) if templated else value, text)
+        if kind == "if":
+            if matcher.search(text):
+                return text + (self._fill(value, context) if templated else value)
+            return text
+        return text.strip()
+
+    def apply(self, text: str, context: Dict[str, str]) -> str:
+        """Run every rule over one prompt"""
+        for step in self.steps:
+            text = self._apply_step(step, text, context)
+        return text
+
+    def apply_bulk(self, texts: List[str], contexts: List[Dict[str, str]]) -> List[str]:
+        """Run every rule over a whole chunk, one rule at a time"""
+        for step in self.steps:
+            kind, matcher, value, templated = step
+            if kind == "table" and not templated:
+                texts = [matcher.sub(lambda m: value[m.group(0)], text) for text in texts]
+            elif kind == "regex" and not templated:
+                texts = [matcher.sub(value, text) for text in texts]
+            else:
+                texts = [self._apply_step(step, text, context) for text, context in zip(texts, contexts)]
+        return texts
+
+
+@functools.lru_cache(maxsize=16)
+def compile_transforms(rules: str) -> Optional[PromptTransforms]:
+    """Compile a rule list once; None when there are no rules"""
+    transforms = PromptTransforms(rules)
+    return transforms if transforms.steps else None
+
+
+def _transform_context(plan: Dict[str, Any], current_index: int) -> Dict[str, str]:
+    suffixes = plan["suffixes"]
+    return {
+        "index": str(current_index),
+        "suffix": suffixes[current_index] if current_index < len(suffixes) else "",
+        "base": plan["base_filename"],
+        "filename": plan["filenames"][current_index]
+    }
+
+
+@functools.lru_cache(maxsize=8)
+def _bulk_compose(rules: str, prompts: Tuple[str, ...], prepend_text: str, append_text: str,
+                  suffixes: Tuple[str, ...], base_filename: str, filenames: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Compose and transform a whole prompt list in one pass, cached per input"""
+    plan = {"suffixes": suffixes, "base_filename": base_filename, "filenames": filenames}
+    texts = [f"{prepend_text}{prompt}{append_text}" for prompt in prompts]
+    transforms = compile_transforms(rules)
+    if transforms is not None:
+        texts = transforms.apply_bulk(texts, [_transform_context(plan, index) for index in range(len(texts))])
+    return tuple(texts)
+
+
+def _compose_prompt(plan: Dict[str, Any], current_index: int) -> str:
+    """Apply the plan's prepend/append text and transform rules to a prompt"""
+    if plan["composed"] is not None:
+        return plan["composed"][current_index]
+    prompt = plan["prompts"][current_index]
+    if plan["prepend_text"] or plan["append_text"]:
+        prompt = f"{plan['prepend_text']}{prompt}{plan['append_text']}"
+    if plan["transforms"] is not None:
+        prompt = plan["transforms"].apply(prompt, _transform_context(plan, current_index))
+    return prompt
+
+
+def peek_upcoming(state_key: str, n: int) -> List[Tuple[int, str, str, Optional[int]]]:
+    """
+    Return the next n (index, prompt, filename, seed) items for an iterator
+    state without advancing it. Seeds are None in random seed mode.
+    Empty until the node has executed once, since the plan comes from its inputs.
+    """
+    state = ITERATOR_STATE.get(state_key)
+    if not state or "plan" not in state:
+        return []
+
+    plan = state["plan"]
+    cursor = {key: list(value) if isinstance(value, list) else value
+              for key, value in state.items() if key != "plan"}
+    total_count = len(plan["prompts"])
+    items = []
+    for _ in range(max(0, n)):
+        index = _advance_cursor(cursor, plan["mode"], plan["loop_mode"], total_count, plan["manual_index"],
+                                plan["random_strategy"], plan["strata"])
+        seed = None if plan["seed_mode"] == "random" else _next_seed(cursor, plan["seed_mode"], index)
+        filename = plan["filenames"][index]
+        items.append((index, _compose_prompt(plan, index), filename, seed))
+    return items
+
+
+def plan_schedule(total_count: int, n: int, mode: str = "sequential", loop_mode: str = "loop",
+                  seed_mode: str = "increment_batch", generation_seed: int = -1,
+                  shuffle_key: Optional[int] = None, random_strategy: str = "shuffle",
+                  group_labels: Optional[List[str]] = None) -> List[Tuple[int, int]]:
+    """
+    Return explicit (index, seed) pairs for n steps from a fresh iterator state,
+    following the same schedule the nodes walk when queued n times.
+    """
+    cursor = _initial_state(generation_seed)
+    if shuffle_key is not None:
+        cursor["shuffle_key"] = shuffle_key
+    strata = build_strata(tuple(group_labels or ()), total_count)
+    items = []
+    for _ in range(max(0, n)):
+        index = _advance_cursor(cursor, mode, loop_mode, total_count, 0, random_strategy, strata)
+        items.append((index, _next_seed(cursor, seed_mode, index)))
+    return items
+
+
+class Prefetcher:
+    """
+    Background pre-reader for files named by upcoming filenames.
+    resolve maps an iterator filename to a path on disk (or None to skip);
+    contents are kept in a bounded LRU cache of max_items entries.
+    """
+
+    def __init__(self, resolve: Callable[[str], Optional[str]], lookahead: int = 2,
+                 max_items: int = 16, max_workers: int = 2):
+        self.resolve = resolve
+        self.lookahead = lookahead
+        self.max_items = max(1, max_items)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prompt_prefetch")
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def warm(self, filenames: List[str]):
+        """Start reading any filenames that are not cached or already loading"""
+        for filename in filenames:
+            path = self.resolve(filename)
+            if not path:
+                continue
+            with self._lock:
+                if path in self._cache or path in self._pending:
+                    continue
+                self._pending[path] = self._executor.submit(self._load, path)
+
+    def get(self, filename: str) -> Optional[bytes]:
+        """Return file contents, waiting on an in-flight read or reading directly on a miss"""
+        path = self.resolve(filename)
+        if not path:
+            return None
+        with self._lock:
+            future = self._pending.get(path)
+        if future is not None:
+            future.result()
+        with self._lock:
+            if path in self._cache:
+                self._cache.move_to_end(path)
+                return self._cache[path]
+        return self._read(path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def _load(self, path: str):
+        data = self._read(path)
+        with self._lock:
+            self._pending.pop(path, None)
+            if data is None:
+                return
+            self._cache[path] = data
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _read(path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as handle:
+                return handle.read()
+        except OSError:
+            return None
+
+
+def attach_prefetcher(state_key: str, prefetcher: Optional[Prefetcher]):
+    """Warm prefetcher with upcoming filenames after each step of an iterator state"""
+    previous = PREFETCHERS.pop(state_key, None)
+    if previous is not None and previous is not prefetcher:
+        previous.shutdown()
+    if prefetcher is not None:
+        PREFETCHERS[state_key] = prefetcher
+
+
+def _prefetch_upcoming(state_key: str):
+    prefetcher = PREFETCHERS.get(state_key)
+    if prefetcher is not None:
+        prefetcher.warm([item[2] for item in peek_upcoming(state_key, prefetcher.lookahead)])
+
+
+class MetadataWriter:
+    """
+    Buffered writer for per-step output metadata.
+    Records are appended to a JSONL sidecar, or to an SQLite database when
+    the path ends in .db/.sqlite/.sqlite3, once batch_size records are pending.
+    A failed write keeps the records pending for the next flush and is kept
+    in error instead of raising, since the sidecar must not fail the graph.
+    """
+
+    FIELDS = ("prompt_hash", "index", "iteration", "seed", "filename", "timestamp")
+    SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+    def __init__(self, path: str, batch_size: int = 32):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.use_sqlite = os.path.splitext(path)[1].lower() in self.SQLITE_EXTENSIONS
+        self._buffer: List[Tuple] = []
+        self._lock = threading.Lock()
+        self.error: Optional[str] = None
+
+    def record(self, prompt: str, index: int, iteration: int, seed: int, filename: str):
+        """Queue one record, flushing the buffer when it is full"""
+        prompt_hash = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            self._buffer.append((prompt_hash, index, iteration, seed, filename, round(time.time(), 3)))
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        """Write all pending records to the sidecar"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        try:
+            self._write(self._buffer)
+        except (OSError, sqlite3.Error) as e:
+            self.error = f"{type(e).__name__}: {e}"
+            return
+        self._buffer = []
+        self.error = None
+
+    def _write(self, pending: List[Tuple]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if self.use_sqlite:
+            connection = sqlite3.connect(self.path)
+            try:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS prompt_metadata ("
+                    "prompt_hash TEXT, idx INTEGER, iteration INTEGER, "
+                    "seed INTEGER, filename TEXT, timestamp REAL)"
+                )
+                connection.executemany(
+                    "INSERT INTO prompt_metadata VALUES (?, ?, ?, ?, ?, ?)", pending
+                )
+                connection.commit()
+            finally:
+                connection.close()
+        else:
+            lines = "".join(
+                json.dumps(dict(zip(self.FIELDS, entry)), separators=(",", ":")) + "\n"
+                for entry in pending
+            )
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.write(lines)
+
+
+def get_metadata_writer(path: str, batch_size: int = 32) -> MetadataWriter:
+    """Return the shared writer for a sidecar path, creating it if needed"""
+    writer = METADATA_WRITERS.get(path)
+    if writer is None:
+        writer = METADATA_WRITERS[path] = MetadataWriter(path, batch_size)
+    else:
+        writer.batch_size = max(1, batch_size)
+    return writer
+
+
+@atexit.register
+def flush_metadata_writers():
+    """Flush every open metadata sidecar"""
+    for writer in list(METADATA_WRITERS.values()):
+        writer.flush()
+        if writer.error:
+            print(f"[PromptIterator] Metadata sidecar {writer.path} not written: {writer.error}")
+
+
 class PromptIteratorDynamic:
     """
     Dynamic prompt iterator node that accepts multiple string inputs
@@ -93,6 +890,9 @@ class PromptIteratorDynamic:
                     "multiline": False,
                     "placeholder": "{base}, {index}, {suffix}"
                 }),
+                "filename_collisions": (["warn", "counter", "short_hash"], {
+                    "default": "warn"
+                }),
                 "manual_index": ("INT", {
                     "default": 0,
                     "min": 0,
@@ -118,6 +918,11 @@ class PromptIteratorDynamic:
                     "default": "default",
                     "multiline": False
                 }),
+                "cursor": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "Serialized cursor, empty to use shared state"
+                }),
             }
         }
 
@@ -132,8 +937,8 @@ class PromptIteratorDynamic:
 
         return inputs
 
-    RETURN_TYPES = ("STRING", "STRING", "INT", "INT", "STRING", "INT")
-    RETURN_NAMES = ("prompt", "filename", "current_index", "total_count", "status", "seed")
+    RETURN_TYPES = ("STRING", "STRING", "INT", "INT", "STRING", "INT", "STRING")
+    RETURN_NAMES = ("prompt", "filename", "current_index", "total_count", "status", "seed", "cursor")
     FUNCTION = "iterate_prompts"
     CATEGORY = "utils/prompt"
     OUTPUT_NODE = False
@@ -141,20 +946,36 @@ class PromptIteratorDynamic:
     @classmethod
     def IS_CHANGED(cls, **kwargs):
         """Force re-execution when inputs change"""
+        if kwargs.get("cursor"):
+            # Explicit cursor makes execution a pure function of inputs
+            return False
         mode = kwargs.get("mode", "sequential")
         if mode in ["sequential", "random"]:
             return float("NaN")
         return False
 
+    @classmethod
+    def peek(cls, n: int, workflow_id: str = "default") -> List[Tuple[int, str, str, Optional[int]]]:
+        """Upcoming (index, prompt, filename, seed) items without advancing the state"""
+        return peek_upcoming(f"{workflow_id}_dynamic", n)
+
+    @classmethod
+    def attach_prefetcher(cls, prefetcher: Optional[Prefetcher], workflow_id: str = "default"):
+        """Warm prefetcher with the next prefetcher.lookahead filenames after each step"""
+        attach_prefetcher(f"{workflow_id}_dynamic", prefetcher)
+
+    @_profiled("dynamic.total")
     def iterate_prompts(self, mode: str, filename_mode: str, base_filename: str,
                        suffixes: str = "", filename_template: str = "",
                        manual_index: int = 0, reset: bool = False,
                        generation_seed: int = -1, seed_mode: str = "increment_batch",
-                       workflow_id: str = "default", **kwargs) -> Tuple:
+                       workflow_id: str = "default", cursor: str = "",
+                       filename_collisions: str = "warn", **kwargs) -> Tuple:
         """
         Main execution function for dynamic prompt iteration
         """
         global ITERATOR_STATE
+        lap = _lap()
 
         # Collect all prompt inputs dynamically
         prompt_list = []
@@ -166,96 +987,36 @@ class PromptIteratorDynamic:
                     prompt_list.append(prompt_value.strip())
 
         if not prompt_list:
-            return ("", base_filename, 0, 0, "Error: No prompts provided")
+            return ("", base_filename, 0, 0, "Error: No prompts provided", 0, cursor)
 
         # Parse suffixes if provided
         suffix_list = [s.strip() for s in suffixes.strip().split('\n') if s.strip()] if suffixes else []
 
         total_count = len(prompt_list)
+        lap = _lap("dynamic.parse", lap)
 
-        # Initialize or get state for this workflow
+        # Use the explicit cursor if given, otherwise the shared state for this workflow
         state_key = f"{workflow_id}_dynamic"
-        if state_key not in ITERATOR_STATE:
-            ITERATOR_STATE[state_key] = {
-                "index": 0,
-                "iteration": 0,
-                "random_order": list(range(total_count)),
-                "base_seed": generation_seed if generation_seed >= 0 else random.randint(0, 2147483647),
-                "current_seed": generation_seed if generation_seed >= 0 else random.randint(0, 2147483647)
-            }
-
-        state = ITERATOR_STATE[state_key]
-
-        # Handle reset
-        if reset:
-            state["index"] = 0
-            state["iteration"] = 0
-            state["random_order"] = list(range(total_count))
-            if generation_seed >= 0:
-                state["base_seed"] = generation_seed
-                state["current_seed"] = generation_seed
-            else:
-                state["base_seed"] = random.randint(0, 2147483647)
-                state["current_seed"] = state["base_seed"]
-
-        # Update random order if needed for prompt shuffling
-        if mode == "random":
-            random.shuffle(state["random_order"])
+        cursor_fields = parse_cursor(cursor)
+        state = _resolve_state(state_key, cursor_fields, generation_seed, reset)
+        lap = _lap("dynamic.state", lap)
 
-        # Determine current index based on mode
-        if mode == "manual":
-            current_index = max(0, min(manual_index, total_count - 1))
-        elif mode == "single":
-            current_index = 0
-        elif mode == "random":
-            current_index = state["random_order"][state["index"]]
-            # Advance for next run
-            state["index"] = (state["index"] + 1) % total_count
-            if state["index"] == 0:
-                state["iteration"] += 1
-        else:  # sequential
-            current_index = state["index"]
-            # Advance for next run
-            state["index"] = (state["index"] + 1) % total_count
-            if state["index"] == 0:
-                state["iteration"] += 1
+        # Determine current index based on mode and advance for next run
+        current_index = _advance_cursor(state, mode, "loop", total_count, manual_index)
+        lap = _lap("dynamic.schedule", lap)
 
         # Get current prompt
         current_prompt = prompt_list[current_index]
 
-        # Generate filename based on mode
-        if filename_mode == "suffix_list" and suffix_list:
-            suffix = suffix_list[current_index] if current_index < len(suffix_list) else f"_{current_index:03d}"
-            current_filename = f"{base_filename}{suffix}"
-        elif filename_mode == "template":
-            suffix = suffix_list[current_index] if current_index < len(suffix_list) else ""
-            current_filename = filename_template.format(
-                base=base_filename,
-                index=current_index,
-                suffix=suffix.lstrip('_')
-            )
-        else:  # auto_index
-            current_filename = f"{base_filename}_{current_index:03d}"
+        # Generate filename based on mode, validated once per input hash
+        filename_args = (filename_mode, base_filename, [], suffix_list, filename_template)
+        filename_plan, duplicates = plan_filenames(filename_args, prompt_list, filename_collisions)
+        current_filename = filename_plan[current_index]
+        lap = _lap("dynamic.filename", lap)
 
         # Handle seed generation based on mode
-        output_seed = state["current_seed"]
-
-        # Determine when to increment seed
-        should_increment = False
-        if seed_mode == "increment_prompt":
-            # Increment on every prompt
-            should_increment = True
-        elif seed_mode == "increment_batch" and current_index == 0 and state["iteration"] > 0:
-            # Increment only when starting a new batch
-            should_increment = True
-        elif seed_mode == "random":
-            # Always randomize
-            output_seed = random.randint(0, 2147483647)
-
-        # Apply increment if needed
-        if should_increment and seed_mode != "random":
-            state["current_seed"] = (state["current_seed"] + 1) % 2147483648
-            output_seed = state["current_seed"]
+        output_seed = _next_seed(state, seed_mode, current_index, cursor_fields is not None)
+        _lap("dynamic.seed", lap)
 
         # Status message
         status = f"Prompt {current_index + 1}/{total_count}"
@@ -263,8 +1024,20 @@ class PromptIteratorDynamic:
             status += f" (Iteration {state['iteration'] + 1})"
         elif mode == "random":
             status += " (random)"
+        status += _filename_status(duplicates, filename_collisions)
+
+        # Remember the plan so upcoming items can be peeked and prefetched
+        if cursor_fields is None:
+            state["plan"] = {
+                "prompts": prompt_list, "mode": mode, "loop_mode": "loop", "seed_mode": seed_mode,
+                "manual_index": manual_index, "filenames": filename_plan,
+                "prepend_text": "", "append_text": "", "random_strategy": "shuffle", "strata": None,
+                "suffixes": suffix_list, "base_filename": base_filename, "transforms": None, "composed": None
+            }
+            _prefetch_upcoming(state_key)
 
-        return (current_prompt, current_filename, current_index, total_count, status, output_seed)
+        return (current_prompt, current_filename, current_index, total_count, status, output_seed,
+                dump_cursor(state))
 
 
 class PromptIterator:
@@ -296,6 +1069,9 @@ class PromptIterator:
                     "default": "",
                     "dynamicPrompts": False
                 }),
+                "filename_collisions": (["warn", "counter", "short_hash"], {
+                    "default": "warn"
+                }),
                 "manual_index": ("INT", {
                     "default": 0,
                     "min": 0,
@@ -311,11 +1087,16 @@ class PromptIterator:
                     "default": "default",
                     "multiline": False
                 }),
+                "cursor": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "Serialized cursor, empty to use shared state"
+                }),
             }
         }
 
-    RETURN_TYPES = ("STRING", "STRING", "INT", "INT", "STRING")
-    RETURN_NAMES = ("prompt", "filename", "current_index", "total_count", "status")
+    RETURN_TYPES = ("STRING", "STRING", "INT", "INT", "STRING", "STRING")
+    RETURN_NAMES = ("prompt", "filename", "current_index", "total_count", "status", "cursor")
     FUNCTION = "iterate_prompt"
     CATEGORY = "utils/prompt"
     OUTPUT_NODE = False
@@ -323,70 +1104,71 @@ class PromptIterator:
     @classmethod
     def IS_CHANGED(cls, **kwargs):
         """Force re-execution when inputs change"""
+        if kwargs.get("cursor"):
+            # Explicit cursor makes execution a pure function of inputs
+            return False
         mode = kwargs.get("mode", "sequential")
         if mode == "sequential":
             # In sequential mode, always re-execute to advance
             return float("NaN")
         return False
 
+    @_profiled("basic.total")
     def iterate_prompt(self, prompts: str, mode: str, base_filename: str,
                       filenames: str = "", manual_index: int = 0,
-                      reset: bool = False, workflow_id: str = "default") -> Tuple:
+                      reset: bool = False, workflow_id: str = "default",
+                      cursor: str = "", filename_collisions: str = "warn") -> Tuple:
         """
         Main execution function for prompt iteration
         """
         global ITERATOR_STATE
+        lap = _lap()
 
         # Parse prompts and filenames
         prompt_list = [p.strip() for p in prompts.strip().split('\n') if p.strip()]
         filename_list = [f.strip() for f in filenames.strip().split('\n') if f.strip()] if filenames else []
 
         if not prompt_list:
-            return ("", base_filename, 0, 0, "Error: No prompts provided")
+            return ("", base_filename, 0, 0, "Error: No prompts provided", cursor)
 
         total_count = len(prompt_list)
+        lap = _lap("basic.parse", lap)
 
-        # Initialize or get state for this workflow
-        if workflow_id not in ITERATOR_STATE:
-            ITERATOR_STATE[workflow_id] = {"index": 0, "iteration": 0}
-
-        state = ITERATOR_STATE[workflow_id]
+        # Use the explicit cursor if given, otherwise the shared state for this workflow
+        cursor_fields = parse_cursor(cursor)
+        if cursor_fields is not None:
+            state = {"index": cursor_fields.get("index", 0), "iteration": cursor_fields.get("iteration", 0)}
+        else:
+            if workflow_id not in ITERATOR_STATE:
+                ITERATOR_STATE[workflow_id] = {"index": 0, "iteration": 0}
+            state = ITERATOR_STATE[workflow_id]
 
         # Handle reset
         if reset:
             state["index"] = 0
             state["iteration"] = 0
+        lap = _lap("basic.state", lap)
 
         # Determine current index based on mode
-        if mode == "manual":
-            current_index = max(0, min(manual_index, total_count - 1))
-        elif mode == "single":
-            # Single mode: always use first prompt
-            current_index = 0
-        else:  # sequential
-            current_index = state["index"]
-            # Advance for next run
-            state["index"] = (state["index"] + 1) % total_count
-            if state["index"] == 0:
-                state["iteration"] += 1
+        current_index = _advance_cursor(state, mode, "loop", total_count, manual_index)
+        lap = _lap("basic.schedule", lap)
 
         # Get current prompt
         current_prompt = prompt_list[current_index]
 
-        # Generate filename
-        if filename_list and current_index < len(filename_list):
-            # Use provided filename
-            current_filename = filename_list[current_index]
-        else:
-            # Generate filename with index
-            current_filename = f"{base_filename}_{current_index:03d}"
+        # Generate filename: provided names first, base_NNN for the rest
+        filename_args = ("list", base_filename, filename_list, [], "")
+        filename_plan, duplicates = plan_filenames(filename_args, prompt_list, filename_collisions)
+        current_filename = filename_plan[current_index]
+        _lap("basic.filename", lap)
 
         # Status message
         status = f"Prompt {current_index + 1}/{total_count}"
         if mode == "sequential":
             status += f" (Iteration {state['iteration'] + 1})"
+        status += _filename_status(duplicates, filename_collisions)
 
-        return (current_prompt, current_filename, current_index, total_count, status)
+        return (current_prompt, current_filename, current_index, total_count, status, dump_cursor(state))
 
 
 class PromptIteratorAdvanced:
@@ -433,6 +1215,9 @@ class PromptIteratorAdvanced:
                     "multiline": False,
                     "placeholder": "Template with {base}, {index}, {suffix} placeholders"
                 }),
+                "filename_collisions": (["warn", "counter", "short_hash"], {
+                    "default": "warn"
+                }),
                 "prepend_text": ("STRING", {
                     "default": "",
                     "multiline": False,
@@ -443,6 +1228,15 @@ class PromptIteratorAdvanced:
                     "multiline": False,
                     "placeholder": "Text to add after each prompt"
                 }),
+                "transforms": ("STRING", {
+                    "multiline": True,
+                    "default": "",
+                    "dynamicPrompts": False,
+                    "placeholder": "One rule per line: prepend:, append:, replace: a => b, regex: p => r, if: p => clause, strip"
+                }),
+                "transform_mode": (["per_item", "bulk"], {
+                    "default": "per_item"
+                }),
                 "manual_index": ("INT", {
                     "default": 0,
                     "min": 0,
@@ -452,6 +1246,15 @@ class PromptIteratorAdvanced:
                 "loop_mode": (["once", "loop", "ping_pong"], {
                     "default": "loop"
                 }),
+                "random_strategy": (["shuffle", "no_repeat", "stratified"], {
+                    "default": "shuffle"
+                }),
+                "groups": ("STRING", {
+                    "multiline": True,
+                    "default": "",
+                    "dynamicPrompts": False,
+                    "placeholder": "One group tag per line for 'stratified' (defaults to suffixes)"
+                }),
                 "reset": ("BOOLEAN", {
                     "default": False,
                     "label_on": "Reset",
@@ -471,11 +1274,35 @@ class PromptIteratorAdvanced:
                     "default": "default",
                     "multiline": False
                 }),
+                "cursor": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "Serialized cursor, empty to use shared state"
+                }),
+                "metadata_file": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "Sidecar path (.jsonl or .db), empty to disable"
+                }),
+                "metadata_batch_size": ("INT", {
+                    "default": 32,
+                    "min": 1,
+                    "max": 4096,
+                    "step": 1
+                }),
+                "batch_size": ("INT", {
+                    "default": 1,
+                    "min": 1,
+                    "max": 64,
+                    "step": 1
+                }),
             }
         }
 
-    RETURN_TYPES = ("STRING", "STRING", "INT", "INT", "STRING", "INT", "STRING")
-    RETURN_NAMES = ("prompt", "filename", "current_index", "total_count", "status", "seed", "debug_info")
+    RETURN_TYPES = ("STRING", "STRING", "INT", "INT", "STRING", "INT", "STRING", "STRING", "STRING", "INT")
+    RETURN_NAMES = ("prompt", "filename", "current_index", "total_count", "status", "seed", "cursor",
+                    "prompt_batch", "filename_batch", "seed_batch")
+    OUTPUT_IS_LIST = (False, False, False, False, False, False, False, True, True, True)
     FUNCTION = "iterate_prompt_advanced"
     CATEGORY = "utils/prompt"
     OUTPUT_NODE = False
@@ -483,23 +1310,42 @@ class PromptIteratorAdvanced:
     @classmethod
     def IS_CHANGED(cls, **kwargs):
         """Force re-execution when needed"""
+        if kwargs.get("cursor"):
+            # Explicit cursor makes execution a pure function of inputs
+            return False
         mode = kwargs.get("mode", "sequential")
         if mode in ["sequential", "random"]:
             return float("NaN")
         return False
 
+    @classmethod
+    def peek(cls, n: int, workflow_id: str = "default") -> List[Tuple[int, str, str, Optional[int]]]:
+        """Upcoming (index, prompt, filename, seed) items without advancing the state"""
+        return peek_upcoming(f"{workflow_id}_advanced", n)
+
+    @classmethod
+    def attach_prefetcher(cls, prefetcher: Optional[Prefetcher], workflow_id: str = "default"):
+        """Warm prefetcher with the next prefetcher.lookahead filenames after each step"""
+        attach_prefetcher(f"{workflow_id}_advanced", prefetcher)
+
+    @_profiled("advanced.total")
     def iterate_prompt_advanced(self, prompts: str, mode: str, filename_mode: str,
                                base_filename: str, filenames: str = "",
                                suffixes: str = "", filename_template: str = "",
                                prepend_text: str = "", append_text: str = "",
                                manual_index: int = 0, loop_mode: str = "loop",
+                               random_strategy: str = "shuffle", groups: str = "",
                                reset: bool = False, generation_seed: int = -1,
                                seed_mode: str = "increment_batch",
-                               workflow_id: str = "default") -> Tuple:
+                               workflow_id: str = "default", metadata_file: str = "",
+                               metadata_batch_size: int = 32, cursor: str = "",
+                               batch_size: int = 1, filename_collisions: str = "warn",
+                               transforms: str = "", transform_mode: str = "per_item") -> Tuple:
         """
         Advanced prompt iteration with enhanced features
         """
         global ITERATOR_STATE
+        lap = _lap()
 
         # Parse inputs
         prompt_list = [p.strip() for p in prompts.strip().split('\n') if p.strip()]
@@ -507,134 +1353,99 @@ class PromptIteratorAdvanced:
         suffix_list = [s.strip() for s in suffixes.strip().split('\n') if s.strip()] if suffixes else []
 
         if not prompt_list:
-            return ("", base_filename, 0, 0, "Error: No prompts provided", "")
+            return ("", base_filename, 0, 0, "Error: No prompts provided", 0, cursor, [""], [base_filename], [0])
 
         total_count = len(prompt_list)
+        lap = _lap("advanced.parse", lap)
 
-        # Initialize or get state
+        # Use the explicit cursor if given, otherwise the shared state for this workflow
         state_key = f"{workflow_id}_advanced"
-        if state_key not in ITERATOR_STATE:
-            ITERATOR_STATE[state_key] = {
-                "index": 0,
-                "iteration": 0,
-                "direction": 1,  # For ping-pong mode
-                "random_order": list(range(total_count)),
-                "base_seed": generation_seed if generation_seed >= 0 else random.randint(0, 2147483647),
-                "current_seed": generation_seed if generation_seed >= 0 else random.randint(0, 2147483647)
-            }
-
-        state = ITERATOR_STATE[state_key]
-
-        # Handle reset
-        if reset:
-            state["index"] = 0
-            state["iteration"] = 0
-            state["direction"] = 1
-            state["random_order"] = list(range(total_count))
-            if generation_seed >= 0:
-                state["base_seed"] = generation_seed
-                state["current_seed"] = generation_seed
-            else:
-                state["base_seed"] = random.randint(0, 2147483647)
-                state["current_seed"] = state["base_seed"]
-
-        # Update random order if needed for prompt shuffling
-        if mode == "random":
-            random.shuffle(state["random_order"])
-
-        # Determine current index
-        if mode == "manual":
-            current_index = max(0, min(manual_index, total_count - 1))
-        elif mode == "single":
-            current_index = 0
-        elif mode == "random":
-            current_index = state["random_order"][state["index"]]
-            # Advance for next run
-            state["index"] = (state["index"] + 1) % total_count
-            if state["index"] == 0:
-                state["iteration"] += 1
-        else:  # sequential
-            current_index = state["index"]
-
-            # Handle loop modes
-            if loop_mode == "once":
-                if state["index"] < total_count - 1:
-                    state["index"] += 1
-            elif loop_mode == "ping_pong":
-                state["index"] += state["direction"]
-                if state["index"] >= total_count - 1:
-                    state["direction"] = -1
-                    state["index"] = total_count - 1
-                elif state["index"] <= 0:
-                    state["direction"] = 1
-                    state["index"] = 0
-                    state["iteration"] += 1
-            else:  # loop
-                state["index"] = (state["index"] + 1) % total_count
-                if state["index"] == 0:
-                    state["iteration"] += 1
-
-        # Build prompt with prepend/append
-        base_prompt = prompt_list[current_index]
-        current_prompt = f"{prepend_text}{base_prompt}{append_text}".strip()
-
-        # Generate filename based on mode
-        if filename_mode == "list" and filename_list and current_index < len(filename_list):
-            current_filename = filename_list[current_index]
-        elif filename_mode == "suffix_list" and suffix_list:
-            suffix = suffix_list[current_index] if current_index < len(suffix_list) else f"_{current_index:03d}"
-            current_filename = f"{base_filename}{suffix}"
-        elif filename_mode == "template":
-            suffix = suffix_list[current_index] if current_index < len(suffix_list) else ""
-            current_filename = filename_template.format(
-                base=base_filename,
-                index=current_index,
-                suffix=suffix.lstrip('_')  # Remove leading underscore if present
-            )
-        else:  # index mode
-            current_filename = f"{base_filename}_{current_index:03d}"
+        cursor_fields = parse_cursor(cursor)
+        state = _resolve_state(state_key, cursor_fields, generation_seed, reset)
+        lap = _lap("advanced.state", lap)
+
+        # Group labels for stratified random order, from tags or else suffixes
+        strata = None
+        if mode == "random" and random_strategy == "stratified":
+            group_list = [g.strip() for g in groups.strip().split('\n') if g.strip()] if groups.strip() else suffix_list
+            strata = build_strata(tuple(group_list), total_count)
+
+        # Resolve every filename once per input hash and check for duplicates
+        filename_args = (filename_mode, base_filename, filename_list, suffix_list, filename_template)
+        filename_plan, duplicates = plan_filenames(filename_args, prompt_list, filename_collisions)
+        lap = _lap("advanced.filename_plan", lap)
+
+        plan = {
+            "prompts": prompt_list, "mode": mode, "loop_mode": loop_mode, "seed_mode": seed_mode,
+            "manual_index": manual_index, "filenames": filename_plan,
+            "prepend_text": prepend_text, "append_text": append_text,
+            "random_strategy": random_strategy, "strata": strata,
+            "suffixes": suffix_list, "base_filename": base_filename,
+            "transforms": compile_transforms(transforms) if transforms.strip() else None,
+            "composed": None
+        }
+        if transform_mode == "bulk":
+            # Transform the whole list once per input and look prompts up afterwards
+            plan["composed"] = _bulk_compose(transforms, tuple(prompt_list), prepend_text, append_text,
+                                             tuple(suffix_list), base_filename, filename_plan)
+        lap = _lap("advanced.compose", lap)
+        writer = get_metadata_writer(metadata_file, metadata_batch_size) if metadata_file else None
+
+        # Emit batch_size consecutive items, advancing the cursor once per item
+        batch_prompts, batch_filenames, batch_indices, batch_seeds = [], [], [], []
+        for _ in range(max(1, batch_size)):
+            # Remember which pass the emitted prompt belongs to
+            current_iteration = state["iteration"]
+
+            # Determine current index and advance for next run
+            current_index = _advance_cursor(state, mode, loop_mode, total_count, manual_index,
+                                            random_strategy, strata)
+            lap = _lap("advanced.schedule", lap)
+
+            # Build prompt with prepend/append
+            current_prompt = _compose_prompt(plan, current_index)
+
+            # Look up the validated filename
+            current_filename = filename_plan[current_index]
+            lap = _lap("advanced.filename", lap)
+
+            # Handle seed generation based on mode
+            output_seed = _next_seed(state, seed_mode, current_index, cursor_fields is not None)
+            if seed_mode == "random":
+                state["current_seed"] = output_seed
+            lap = _lap("advanced.seed", lap)
+
+            # Append a compact record to the metadata sidecar
+            if writer is not None:
+                writer.record(current_prompt, current_index, current_iteration, output_seed, current_filename)
+
+            batch_prompts.append(current_prompt)
+            batch_filenames.append(current_filename)
+            batch_indices.append(current_index)
+            batch_seeds.append(output_seed)
 
         # Build status
-        status = f"Prompt {current_index + 1}/{total_count}"
+        status = f"Prompt {batch_indices[0] + 1}/{total_count}"
         if mode == "sequential":
             status += f" | Iteration {state['iteration'] + 1}"
             if loop_mode == "ping_pong":
                 status += " (ping-pong)"
         elif mode == "random":
-            status += " (random)"
-
-        # Handle seed generation based on mode
-        output_seed = state["current_seed"]
-
-        # Determine if we should increment the seed
-        should_increment = False
-        if seed_mode == "increment_prompt":
-            should_increment = True
-        elif seed_mode == "increment_batch" and current_index == 0 and state["iteration"] > 0:
-            should_increment = True
-        elif seed_mode == "random":
-            output_seed = random.randint(0, 2147483647)
-            state["current_seed"] = output_seed
-
-        # Apply increment if needed
-        if should_increment and seed_mode != "random":
-            state["current_seed"] = (state["current_seed"] + 1) % 2147483648
-            output_seed = state["current_seed"]
-
-        # Debug info
-        debug_info = json.dumps({
-            "mode": mode,
-            "filename_mode": filename_mode,
-            "current_index": current_index,
-            "state_index": state["index"],
-            "iteration": state["iteration"],
-            "loop_mode": loop_mode,
-            "filename": current_filename,
-            "seed": output_seed,
-            "seed_mode": seed_mode
-        }, indent=2)
-
-        return (current_prompt, current_filename, current_index, total_count, status, output_seed)
+            status += " (random)" if random_strategy == "shuffle" else f" (random, {random_strategy})"
+        if len(batch_indices) > 1:
+            status += f" | Batch of {len(batch_indices)}"
+        status += _filename_status(duplicates, filename_collisions)
+        if writer is not None and writer.error:
+            status += f" | Metadata not written ({writer.error})"
+
+        # Remember the plan so upcoming items can be peeked and prefetched
+        if cursor_fields is None:
+            state["plan"] = plan
+            _prefetch_upcoming(state_key)
+        _lap("advanced.bookkeeping", lap)
+
+        return (batch_prompts[0], batch_filenames[0], batch_indices[0], total_count, status, batch_seeds[0],
+                dump_cursor(state), batch_prompts, batch_filenames, batch_seeds)
 
 
 # Node registration
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the headless batch driver against a local stub server
+"""
+
+import sys
+import os
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batch_driver import BatchDriver, build_sweep, main
+
+WORKFLOW = {
+    "3": {"class_type": "KSampler", "inputs": {"seed": ["10", 5]}},
+    "10": {
+        "class_type": "PromptIteratorAdvanced",
+        "inputs": {
+            "prompts": "front\nleft\nright\nback",
+            "mode": "sequential",
+            "filename_mode": "suffix_list",
+            "base_filename": "character",
+            "generation_seed": 500,
+            "seed_mode": "increment_batch",
+            "batch_size": 4,
+        }
+    }
+}
+
+
+class StubComfyHandler(BaseHTTPRequestHandler):
+    """Minimal /prompt and /history endpoints that finish each prompt after a delay"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.ports.add(self.client_address[1])
+            server.posts += 1
+            if server.posts == 1:
+                # First submission fails once to exercise retries
+                return self._send(500, {"error": "busy"})
+            prompt_id = f"p{len(server.queued)}"
+            server.queued[prompt_id] = (body["prompt"]["10"]["inputs"], time.monotonic())
+            server.max_in_flight = max(server.max_in_flight, self._in_flight())
+        self._send(200, {"prompt_id": prompt_id, "number": 0, "node_errors": {}})
+
+    def do_GET(self):
+        server = self.server
+        prompt_id = self.path.rsplit("/", 1)[-1]
+        with server.lock:
+            server.ports.add(self.client_address[1])
+            inputs, queued_at = server.queued[prompt_id]
+            if time.monotonic() - queued_at < 0.05:
+                return self._send(200, {})
+            server.done.add(prompt_id)
+        # The last pass's index 3 fails on the server
+        failed = inputs["manual_index"] == 3 and inputs["generation_seed"] == 501
+        self._send(200, {prompt_id: {
+            "status": {"status_str": "error" if failed else "success"},
+            "outputs": {"9": {"images": [{"filename": f"out_{inputs['manual_index']}.png"}]}}
+        }})
+
+    def _in_flight(self):
+        return len(set(self.server.queued) - self.server.done)
+
+
+def test_batch_driver():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubComfyHandler)
+    server.lock = threading.Lock()
+    server.ports, server.queued, server.done = set(), {}, set()
+    server.posts, server.max_in_flight = 0, 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        driver = BatchDriver(f"http://127.0.0.1:{server.server_port}", window=2,
+                             backoff=0.01, poll_interval=0.01)
+        results = driver.run(WORKFLOW, passes=2)
+        queued = list(server.queued.values())
+        ports = set(server.ports)
+
+        # The command line reports the failed render through its exit code
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            workflow_path = os.path.join(tmp_dir, "workflow_api.json")
+            with open(workflow_path, "w", encoding="utf-8") as handle:
+                json.dump(WORKFLOW, handle)
+            exit_code = main([workflow_path, "--server", f"http://127.0.0.1:{server.server_port}", "--passes", "2"])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    expected = build_sweep(WORKFLOW["10"], passes=2)
+    assert [(r["index"], r["seed"]) for r in results] == expected
+    assert [index for index, _ in expected] == [0, 1, 2, 3, 0, 1, 2, 3]
+    assert [seed for _, seed in expected] == [500, 500, 500, 500, 501, 501, 501, 501]
+    print("  [OK] Sweep covers every index with explicit seeds")
+
+    assert sum(r["attempts"] for r in results) == len(results) + 1
+    print("  [OK] Failed submission was retried")
+
+    failed = [r for r in results if r["error"]]
+    assert [(r["index"], r["seed"], r["status"]) for r in failed] == [(3, 501, "error")]
+    assert all(r["status"] == "success" for r in results if r not in failed)
+    assert exit_code == 1
+    print("  [OK] Render that failed on the server is counted as failed")
+
+    submitted = sorted((inputs["manual_index"], inputs["generation_seed"], inputs["mode"])
+                       for inputs, _ in queued)
+    assert submitted == sorted((index, seed, "manual") for index, seed in expected)
+    assert all(inputs["batch_size"] == 1 for inputs, _ in queued)
+    assert server.max_in_flight <= 2, f"In-flight window exceeded: {server.max_in_flight}"
+    print(f"  [OK] In-flight window respected (max {server.max_in_flight})")
+
+    # One keep-alive connection per worker, plus one reconnect after the 500
+    assert len(ports) <= 3, f"Connections not reused: {len(ports)}"
+    print(f"  [OK] HTTP connections reused ({len(ports)} opened)")
+
+
+if __name__ == "__main__":
+    print("Testing Batch Driver...")
+    print("=" * 50)
+    test_batch_driver()
+    print("=" * 50)
+    print("Batch Driver Test Complete!")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test script to verify lookahead (peek) and prefetching of upcoming items
+"""
+
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from prompt_iterator import PromptIteratorDynamic, PromptIteratorAdvanced, Prefetcher, _permute_index, plan_schedule
+
+TEST_PROMPTS = "portrait\nlandscape\nabstract\nstill life\nmacro"
+
+
+def run_advanced(node, workflow_id, **kwargs):
+    options = dict(
+        prompts=TEST_PROMPTS,
+        mode="sequential",
+        filename_mode="index",
+        base_filename="test",
+        generation_seed=100,
+        seed_mode="increment_prompt",
+        workflow_id=workflow_id
+    )
+    options.update(kwargs)
+    result = node.iterate_prompt_advanced(**options)
+    return (result[2], result[0], result[1], result[5])
+
+
+def test_permutation():
+    """Keyed permutations cover every index exactly once"""
+    for total in (1, 2, 3, 7, 64, 1000):
+        order = [_permute_index(i, total, 12345) for i in range(total)]
+        assert sorted(order) == list(range(total)), f"Not a permutation for {total}"
+    print("  [OK] Keyed permutation is a bijection")
+
+
+def test_peek_matches_execution():
+    """peek(n) predicts the next n executions without advancing the state"""
+    node = PromptIteratorAdvanced()
+    cases = [
+        ("peek_loop", dict(loop_mode="loop")),
+        ("peek_pingpong", dict(loop_mode="ping_pong", seed_mode="increment_batch")),
+        ("peek_once", dict(loop_mode="once")),
+        ("peek_random", dict(mode="random", prepend_text="photo of ")),
+    ]
+    for workflow_id, options in cases:
+        run_advanced(node, workflow_id, **options)
+        upcoming = PromptIteratorAdvanced.peek(12, workflow_id=workflow_id)
+        assert upcoming == PromptIteratorAdvanced.peek(12, workflow_id=workflow_id), "peek advanced the state"
+        actual = [run_advanced(node, workflow_id, **options) for _ in range(12)]
+        assert upcoming == actual, f"{workflow_id}: {upcoming} != {actual}"
+        print(f"  [OK] Advanced {workflow_id} lookahead matches execution")
+
+    dynamic = PromptIteratorDynamic()
+    run = lambda: dynamic.iterate_prompts(
+        prompt_1="one", prompt_2="two", prompt_3="three", mode="random",
+        filename_mode="auto_index", base_filename="dyn", generation_seed=5,
+        seed_mode="increment_batch", workflow_id="peek_dynamic")
+    run()
+    upcoming = PromptIteratorDynamic.peek(6, workflow_id="peek_dynamic")
+    actual = [(r[2], r[0], r[1], r[5]) for r in (run() for _ in range(6))]
+    assert upcoming == actual, f"{upcoming} != {actual}"
+    # Every pass of the random mode visits each prompt once
+    assert sorted(index for index, _, _, _ in actual[2:5]) == [0, 1, 2]
+    print("  [OK] Dynamic random lookahead matches execution")
+
+
+def test_random_strategies():
+    """Stratified and no-repeat random orders keep their coverage guarantees"""
+    node = PromptIteratorAdvanced()
+    prompts = "\n".join(f"prompt {i}" for i in range(8))
+    groups = "a\na\na\na\nb\nb\nc\nc"
+    options = dict(prompts=prompts, mode="random", random_strategy="stratified", groups=groups)
+
+    run_advanced(node, "strat", **options)
+    upcoming = PromptIteratorAdvanced.peek(15, workflow_id="strat")
+    indices = [run_advanced(node, "strat", **options)[0] for _ in range(31)]
+    assert upcoming == [(i, f"prompt {i}", f"test_{i:03d}", 100 + n + 2) for n, i in enumerate(indices[:15])]
+    indices = indices[7:]  # Align to pass boundaries
+    for start in range(0, 24, 8):
+        chunk = indices[start:start + 8]
+        assert sorted(chunk) == list(range(8)), f"Pass is not a permutation: {chunk}"
+        labels = ["a" if i < 4 else "b" if i < 6 else "c" for i in chunk]
+        for step in range(1, 9):
+            for group, size in (("a", 4), ("b", 2), ("c", 2)):
+                share = step * size / 8
+                assert abs(labels[:step].count(group) - share) < 1, f"Group {group} is not spread evenly: {labels}"
+    print("  [OK] Stratified order spreads each group evenly within every pass")
+
+    options = dict(prompts="x\ny\nz", mode="random", random_strategy="no_repeat")
+    indices = [run_advanced(node, "norepeat", reset=(n == 0), **options)[0] for n in range(300)]
+    for start in range(0, 300, 3):
+        assert sorted(indices[start:start + 3]) == [0, 1, 2]
+    assert all(indices[n] != indices[n + 1] for n in range(2, 299, 3)), "Prompt repeated at a pass boundary"
+
+    # With two prompts a boundary swap changes which prompt closes the pass
+    for shuffle_key in range(20):
+        schedule = plan_schedule(2, 100, mode="random", random_strategy="no_repeat",
+                                 shuffle_key=shuffle_key, generation_seed=1)
+        indices = [index for index, _ in schedule]
+        assert all(sorted(indices[start:start + 2]) == [0, 1] for start in range(0, 100, 2))
+        assert all(indices[n] != indices[n + 1] for n in range(99)), f"Repeat with two prompts: {indices}"
+    print("  [OK] No-repeat order never repeats a prompt across pass boundaries")
+
+
+def test_prefetcher():
+    """Upcoming filenames are read into the prefetch cache"""
+    node = PromptIteratorAdvanced()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i in range(5):
+            with open(os.path.join(tmp_dir, f"ref_{i:03d}.txt"), "w") as handle:
+                handle.write(f"reference {i}")
+
+        resolve = lambda name: os.path.join(tmp_dir, name.replace("test_", "ref_") + ".txt")
+        prefetcher = Prefetcher(resolve, lookahead=2, max_items=2)
+        PromptIteratorAdvanced.attach_prefetcher(prefetcher, workflow_id="prefetch")
+        try:
+            run_advanced(node, "prefetch")
+            assert prefetcher.get("test_001") == b"reference 1"
+            assert prefetcher.get("test_002") == b"reference 2"
+            assert prefetcher.get("test_404") is None
+            run_advanced(node, "prefetch")
+            prefetcher.get("test_003")
+            assert len(prefetcher._cache) <= 2, "Cache exceeded max_items"
+        finally:
+            PromptIteratorAdvanced.attach_prefetcher(None, workflow_id="prefetch")
+    print("  [OK] Prefetcher warms upcoming files into a bounded cache")
+
+
+if __name__ == "__main__":
+    print("Testing Lookahead...")
+    print("=" * 50)
+    test_permutation()
+    test_peek_matches_execution()
+    test_random_strategies()
+    test_prefetcher()
+    print("=" * 50)
+    print("Lookahead Test Complete!")
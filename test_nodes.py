@@ -65,7 +65,7 @@ try:
         manual_index=0,
         loop_mode="loop",
         reset=False,
-        random_seed=-1,
+        generation_seed=-1,
         workflow_id="test"
     )
     print("[OK] Advanced node execution successful")
@@ -74,6 +74,261 @@ except Exception as e:
     print(f"[ERROR] Advanced node execution failed: {e}")
     exit(1)
 
+# Test metadata sidecar
+try:
+    import json
+    import os
+    import sqlite3
+    import tempfile
+    from prompt_iterator import flush_metadata_writers
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jsonl_path = os.path.join(tmp_dir, "meta.jsonl")
+        db_path = os.path.join(tmp_dir, "meta.db")
+        for _ in range(5):
+            for path in (jsonl_path, db_path):
+                advanced_node.iterate_prompt_advanced(
+                    prompts="face front\nface left",
+                    mode="sequential",
+                    filename_mode="index",
+                    base_filename="meta",
+                    generation_seed=7,
+                    seed_mode="fixed",
+                    workflow_id=f"test_meta_{os.path.basename(path)}",
+                    metadata_file=path,
+                    metadata_batch_size=2
+                )
+        # Two full batches are written, the fifth record is still buffered
+        with open(jsonl_path, encoding="utf-8") as handle:
+            assert len(handle.readlines()) == 4
+        flush_metadata_writers()
+        with open(jsonl_path, encoding="utf-8") as handle:
+            records = [json.loads(line) for line in handle]
+        assert [r["index"] for r in records] == [0, 1, 0, 1, 0]
+        assert [r["iteration"] for r in records] == [0, 0, 1, 1, 2]
+        assert records[0]["filename"] == "meta_000" and records[0]["seed"] == 7
+        connection = sqlite3.connect(db_path)
+        assert connection.execute("SELECT COUNT(*) FROM prompt_metadata").fetchone()[0] == 5
+        connection.close()
+
+        # A failed write is reported in status and the records are kept for the next flush
+        blocked_dir = os.path.join(tmp_dir, "blocked")
+        with open(blocked_dir, "w") as handle:
+            handle.write("not a directory")
+        blocked_path = os.path.join(blocked_dir, "meta.jsonl")
+        failed = [advanced_node.iterate_prompt_advanced(prompts="face front\nface left", mode="sequential",
+                                                        filename_mode="index", base_filename="meta",
+                                                        workflow_id="test_meta_blocked", metadata_file=blocked_path,
+                                                        metadata_batch_size=1)
+                  for _ in range(2)]
+        assert "Metadata not written" in failed[1][4]
+        os.remove(blocked_dir)
+        flush_metadata_writers()
+        with open(blocked_path, encoding="utf-8") as handle:
+            assert [json.loads(line)["index"] for line in handle] == [0, 1]
+    print("[OK] Metadata sidecar written in batches")
+except Exception as e:
+    print(f"[ERROR] Metadata sidecar failed: {e}")
+    exit(1)
+
+# Test explicit cursor input/output
+try:
+    from prompt_iterator import ITERATOR_STATE
+
+    options = dict(
+        prompts="one\ntwo\nthree",
+        mode="sequential",
+        filename_mode="index",
+        base_filename="cursor",
+        loop_mode="ping_pong",
+        generation_seed=42,
+        seed_mode="increment_batch",
+    )
+    shared = [advanced_node.iterate_prompt_advanced(workflow_id="test_cursor_shared", **options)
+              for _ in range(7)]
+
+    keys_before = set(ITERATOR_STATE)
+    cursor = '{"index":0}'
+    chained = []
+    for _ in range(7):
+        result = advanced_node.iterate_prompt_advanced(workflow_id="test_cursor", cursor=cursor, **options)
+        chained.append(result)
+        cursor = result[6]
+    assert [r[:6] for r in chained] == [r[:6] for r in shared]
+    assert set(ITERATOR_STATE) == keys_before
+    # Same cursor in, same outputs out
+    repeat = advanced_node.iterate_prompt_advanced(workflow_id="other", cursor=chained[3][6], **options)
+    assert repeat == chained[4]
+    assert NODE_CLASS_MAPPINGS["PromptIteratorAdvanced"].IS_CHANGED(cursor=cursor, mode="sequential") is False
+
+    # Incomplete cursors and random modes are still pure
+    random_options = dict(options, mode="random", generation_seed=-1, seed_mode="random")
+    for partial in ("{}", '{"index":0}'):
+        runs = [advanced_node.iterate_prompt_advanced(workflow_id="test_cursor", cursor=partial, **random_options)
+                for _ in range(3)]
+        assert runs[0] == runs[1] == runs[2], f"Cursor {partial} is not deterministic"
+        assert json.loads(runs[0][6])["current_seed"] == runs[0][5]
+
+    basic_result = basic_node.iterate_prompt(prompts="a\nb", mode="sequential", base_filename="b",
+                                             cursor='{"index":1,"iteration":3}')
+    assert basic_result[0] == "b" and basic_result[5] == '{"index":0,"iteration":4}'
+    print("[OK] Cursor round-trip is stateless")
+except Exception as e:
+    print(f"[ERROR] Cursor round-trip failed: {e}")
+    exit(1)
+
+# Test batch emission
+try:
+    options = dict(
+        prompts="one\ntwo\nthree\nfour",
+        mode="sequential",
+        filename_mode="index",
+        base_filename="batch",
+        generation_seed=10,
+        seed_mode="increment_prompt",
+    )
+    singles = [advanced_node.iterate_prompt_advanced(workflow_id="test_single", **options) for _ in range(6)]
+    first = advanced_node.iterate_prompt_advanced(workflow_id="test_batch", batch_size=4, **options)
+    second = advanced_node.iterate_prompt_advanced(workflow_id="test_batch", batch_size=2, **options)
+    assert first[7] == [r[0] for r in singles[:4]] and second[7] == [r[0] for r in singles[4:]]
+    assert first[8] == [r[1] for r in singles[:4]]
+    assert first[9] + second[9] == [11, 12, 13, 14, 15, 16]
+    assert first[:3] == singles[0][:3] and first[5] == singles[0][5]
+    progress = lambda cursor: {k: v for k, v in json.loads(cursor).items() if k != "shuffle_key"}
+    assert progress(second[6]) == progress(singles[5][6]), "Cursor did not advance by the batch size"
+    print("[OK] Batch emission advances the cursor by batch_size")
+except Exception as e:
+    print(f"[ERROR] Batch emission failed: {e}")
+    exit(1)
+
+# Test filename collision handling
+try:
+    options = dict(
+        prompts="red car\nblue car\nred car\ngreen car",
+        mode="sequential",
+        filename_mode="template",
+        base_filename="car",
+        suffixes="",
+        filename_template="{base}",
+    )
+    warned = [advanced_node.iterate_prompt_advanced(workflow_id="test_names_warn", **options) for _ in range(4)]
+    assert [r[1] for r in warned] == ["car"] * 4
+    assert "3 duplicate filename(s)" in warned[0][4]
+
+    counted = [advanced_node.iterate_prompt_advanced(workflow_id="test_names_counter",
+                                                     filename_collisions="counter", **options)
+               for _ in range(4)]
+    assert [r[1] for r in counted] == ["car", "car_2", "car_3", "car_4"]
+    assert "3 filename(s) disambiguated" in counted[0][4]
+
+    hashed = [advanced_node.iterate_prompt_advanced(workflow_id="test_names_hash",
+                                                    filename_collisions="short_hash", **options)
+              for _ in range(4)]
+    names = [r[1] for r in hashed]
+    assert len(set(names)) == 4 and names[0] == "car" and names[1].startswith("car_")
+
+    # The basic node's base_NNN fallback can repeat an explicit filename
+    basic_options = dict(prompts="a\nb\nc", mode="sequential", base_filename="img",
+                         filenames="img_002\nsecond", filename_collisions="counter")
+    basic = [basic_node.iterate_prompt(workflow_id="test_names_basic", **basic_options) for _ in range(3)]
+    assert [r[1] for r in basic] == ["img_002", "second", "img_002_2"]
+    assert "1 filename(s) disambiguated" in basic[0][4]
+    print("[OK] Duplicate filenames are reported and disambiguated")
+except Exception as e:
+    print(f"[ERROR] Filename collision handling failed: {e}")
+    exit(1)
+
+# Test prompt transform rules
+try:
+    rules = "\n".join([
+        "# Literal table, regex rewrite, conditional clause and per-item text",
+        "replace: cat => dog",
+        "replace: dog => wolf",
+        "replace: right => rear",
+        "regex: (\\w+) profile => \\1-side profile",
+        "if: left => , looking left",
+        "append: , view {index}{suffix}",
+    ])
+    options = dict(
+        prompts="cat left profile\ndog right profile",
+        mode="sequential",
+        filename_mode="suffix_list",
+        base_filename="pet",
+        suffixes="_l\n_r",
+        prepend_text="photo: ",
+        transforms=rules,
+    )
+    per_item = [advanced_node.iterate_prompt_advanced(workflow_id="test_rules", **options)[0] for _ in range(2)]
+    bulk = [advanced_node.iterate_prompt_advanced(workflow_id="test_rules_bulk", transform_mode="bulk",
+                                                  **options)[0] for _ in range(2)]
+    assert per_item == ["photo: wolf left-side profile, looking left, view 0_l",
+                        "photo: wolf rear-side profile, view 1_r"], per_item
+    assert bulk == per_item
+    # Chained replacements stay ordered, independent ones share a table
+    from prompt_iterator import compile_transforms
+    assert [step[0] for step in compile_transforms(rules).steps] == ["table", "table", "regex", "if", "append"]
+    # Text joined by a deletion is still seen by the next rule
+    assert compile_transforms("replace: not  => \nreplace: a big dog => a cat").apply("a not big dog", {}) == "a cat"
+    try:
+        advanced_node.iterate_prompt_advanced(workflow_id="test_rules_bad", **dict(options, transforms="swap: a"))
+        raise AssertionError("Invalid rule was accepted")
+    except ValueError:
+        pass
+    print("[OK] Transform rules compile once and match in per-item and bulk modes")
+except Exception as e:
+    print(f"[ERROR] Transform rules failed: {e}")
+    exit(1)
+
+# Test profiling ring buffers
+try:
+    import time
+    from prompt_iterator import StepProfiler
+
+    profiler = StepProfiler(capacity=100)
+    for _ in range(250):
+        profiler.lap("test.phase", time.perf_counter_ns())
+    stats = profiler.histograms()["test.phase"]
+    assert stats["count"] == 100
+    assert stats["p50_us"] <= stats["p95_us"] <= stats["p99_us"] <= stats["max_us"]
+    assert "test.phase" in profiler.report()
+    print("[OK] Profiler keeps bounded per-phase histograms")
+
+    # The environment switches are read at import, so check them in fresh interpreters
+    import subprocess
+    import sys
+    probe = "\n".join([
+        "import json, prompt_iterator as pi",
+        "node = pi.PromptIteratorAdvanced()",
+        "prefetcher = pi.Prefetcher(lambda name: name, lookahead=8)",
+        "pi.PromptIteratorAdvanced.attach_prefetcher(prefetcher, workflow_id='profile')",
+        "for _ in range(10):",
+        "    node.iterate_prompt_advanced(prompts='a\\nb', mode='sequential', filename_mode='index',",
+        "                                 base_filename='p', transforms='append: !', workflow_id='profile')",
+        "print(json.dumps({'enabled': pi.PROFILER is not None,",
+        "                  'wrapped': hasattr(pi.PromptIteratorAdvanced.iterate_prompt_advanced, '__wrapped__'),",
+        "                  'phases': {phase: stats['count'] for phase, stats in pi.PROFILER.histograms().items()}",
+        "                            if pi.PROFILER else {}}))",
+    ])
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    base_env = {k: v for k, v in os.environ.items() if not k.startswith("PROMPT_ITERATOR_")}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prof_path = os.path.join(tmp_dir, "iter.prof")
+        runs = {}
+        for name, extra in (("off", {}), ("on", {"PROMPT_ITERATOR_PROFILE": "1", "PROMPT_ITERATOR_CPROFILE": prof_path})):
+            output = subprocess.run([sys.executable, "-c", probe], cwd=package_dir, env=dict(base_env, **extra),
+                                    capture_output=True, text=True, check=True).stdout
+            runs[name] = json.loads(output.strip().splitlines()[-1])
+        assert runs["off"] == {"enabled": False, "wrapped": False, "phases": {}}, runs["off"]
+        assert runs["on"]["enabled"] and runs["on"]["wrapped"]
+        # One sample per step and phase, lookahead is not counted
+        phases = ("total", "parse", "state", "filename_plan", "compose", "schedule", "filename", "seed", "bookkeeping")
+        assert runs["on"]["phases"] == {f"advanced.{phase}": 10 for phase in phases}, runs["on"]["phases"]
+        assert os.path.getsize(prof_path) > 0, "cProfile dump was not written"
+    print("[OK] Profiling switches on from the environment and dumps cProfile stats")
+except Exception as e:
+    print(f"[ERROR] Profiler failed: {e}")
+    exit(1)
+
 print("\n[SUCCESS] All tests passed! The extension should work in ComfyUI.")
 print("\nIf ComfyUI still doesn't recognize the nodes:")
 print("1. Make sure ComfyUI is fully restarted")